@@ -5,16 +5,18 @@ import toga
 from toga.style import Pack
 from toga.style.pack import COLUMN, ROW, CENTER
 import os
-import re
+import subprocess
+import sys
 from pathlib import Path
 import asyncio
 
-# PDF processing
-try:
-    from pdfminer.high_level import extract_text
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+from pdf_tts_core import (
+    DEFAULT_CACHE_TTL_SECS, PDF_AVAILABLE, PageCache, UringWriter,
+    count_pdf_pages, read_pdf_pages
+)
+
+# Command used to open a file with its default application
+_OPENER = {'win32': None, 'darwin': ['open']}.get(sys.platform, ['xdg-open'])
 
 class PDFToSpeechApp(toga.App):
     def startup(self):
@@ -99,6 +101,10 @@ class PDFToSpeechApp(toga.App):
         self.pdf_path = None
         self.output_dir = Path.home() / "PDFtoSpeech"
         self.output_dir.mkdir(exist_ok=True)
+        
+        # Extracted text cache
+        self.cache_ttl_secs = DEFAULT_CACHE_TTL_SECS
+        self.page_cache = PageCache(self.output_dir / ".cache", self.cache_ttl_secs)
     
     def select_pdf(self, widget):
         """Select PDF file"""
@@ -123,31 +129,28 @@ class PDFToSpeechApp(toga.App):
         try:
             self.progress_label.text = "Converting PDF..."
             
-            # Extract text from PDF
+            # Pages are extracted as the loop consumes them
+            total_pages = count_pdf_pages(self.pdf_path)
             pages = self.read_pdf_pages(self.pdf_path)
-            if not pages:
+            converted = 0
+            
+            # Convert each page, batching the page file writes
+            with UringWriter() as writer:
+                for i, text in enumerate(pages):
+                    # Save as text file for now (TTS would need platform-specific implementation)
+                    output_file = self.output_dir / f"page_{i+1:04d}.txt"
+                    writer.write(output_file, text.encode('utf-8'))
+                    
+                    # Add to output list
+                    self.add_output_file(output_file)
+                    converted += 1
+                    
+                    self.progress_label.text = f"Converted page {i+1}/{total_pages}"
+            
+            if not converted:
                 self.main_window.info_dialog("Error", "No text found in PDF")
                 return
             
-            # Convert each page
-            for i, page_text in enumerate(pages):
-                if not page_text.strip():
-                    continue
-                
-                # Normalize text
-                text = self.normalize_text(page_text)
-                if not text:
-                    continue
-                
-                # Save as text file for now (TTS would need platform-specific implementation)
-                output_file = self.output_dir / f"page_{i+1:04d}.txt"
-                output_file.write_text(text, encoding='utf-8')
-                
-                # Add to output list
-                self.add_output_file(output_file)
-                
-                self.progress_label.text = f"Converted page {i+1}/{len(pages)}"
-            
             self.progress_label.text = "Conversion complete!"
             self.main_window.info_dialog("Success", "PDF converted successfully!")
             
@@ -155,23 +158,11 @@ class PDFToSpeechApp(toga.App):
             self.main_window.error_dialog("Error", f"Conversion failed: {e}")
     
     def read_pdf_pages(self, pdf_path: Path):
-        """Extract text from PDF as list of pages"""
+        """Extract normalized text from PDF one page at a time"""
         try:
-            full_text = extract_text(str(pdf_path)) or ""
-            pages = full_text.split("\f")
-            pages = [p for p in pages if p.strip() != ""]
-            return pages
+            yield from read_pdf_pages(pdf_path, self.page_cache)
         except Exception as e:
             print(f"Failed to read PDF: {e}")
-            return []
-    
-    def normalize_text(self, txt: str) -> str:
-        """Clean up text formatting"""
-        txt = txt.replace("\r", "\n")
-        txt = re.sub(r"[ \t]+", " ", txt)
-        txt = re.sub(r"\n{3,}", "\n\n", txt)
-        txt = "\n".join(line.strip() for line in txt.splitlines())
-        return txt.strip()
     
     def add_output_file(self, file_path: Path):
         """Add output file to the list"""
@@ -185,12 +176,18 @@ class PDFToSpeechApp(toga.App):
     def open_file(self, file_path: Path):
         """Open file with default application"""
         try:
-            os.startfile(str(file_path))  # Windows
-        except:
-            try:
-                os.system(f"open {file_path}")  # macOS
-            except:
-                os.system(f"xdg-open {file_path}")  # Linux
+            if _OPENER is None:
+                os.startfile(str(file_path))  # Windows
+            else:
+                subprocess.Popen(
+                    _OPENER + [str(file_path)],
+                    close_fds=True,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+        except OSError as e:
+            self.main_window.info_dialog("Error", f"Could not open file: {e}")
 
 def main():
     return PDFToSpeechApp('PDF to Speech', 'com.example.pdftospeech')
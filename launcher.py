@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import os
 import subprocess
+import sys
+import threading
+
+DEPENDENCIES = ("pdfminer.six", "pyttsx3")
 
 def show_menu():
     print("\n" + "="*40)
@@ -12,10 +16,40 @@ def show_menu():
     print("4. Exit")
     print("="*40)
 
+def _pip_install(pkg):
+    return subprocess.Popen(
+        [sys.executable, "-m", "pip", "install", "--disable-pip-version-check", pkg],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+
+def _relay_output(pkg, proc):
+    for line in proc.stdout:
+        # A single write per line keeps the two installs' output unmixed
+        sys.stdout.write(f"[{pkg}] {line}")
+        sys.stdout.flush()
+
 def install_deps():
     print("Installing dependencies...")
-    subprocess.run(["pip", "install", "pdfminer.six", "pyttsx3"])
-    print("Dependencies installed!")
+    procs = {pkg: _pip_install(pkg) for pkg in DEPENDENCIES}
+
+    # One reader per install so both outputs stream as they arrive
+    readers = [
+        threading.Thread(target=_relay_output, args=(pkg, proc), daemon=True)
+        for pkg, proc in procs.items()
+    ]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+
+    failed = [pkg for pkg, proc in procs.items() if proc.wait() != 0]
+    if failed:
+        print(f"Failed to install: {', '.join(failed)}")
+    else:
+        print("Dependencies installed!")
 
 def list_pdfs():
     pdf_files = [f for f in os.listdir('.') if f.endswith('.pdf')]
@@ -1,27 +1,33 @@
 # main.py - Kivy Android App for PDF to Speech
+import asyncio
+import hashlib
 import os
 import json
 import logging
-import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.filechooser import FileChooserListView
-from kivy.uix.popup import Popup
 from kivy.uix.progressbar import ProgressBar
 from kivy.uix.slider import Slider
 from kivy.uix.spinner import Spinner
 from kivy.clock import Clock
 from kivy.utils import platform
-from kivy.core.audio import SoundLoader
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.gridlayout import GridLayout
 
+from pdf_tts_core import (
+    DEFAULT_CACHE_TTL_SECS, PDF_AVAILABLE, PageCache, UringWriter,
+    count_pdf_pages, link_or_copy, read_pdf_pages,
+    split_into_chunks
+)
+
 # Android-specific imports
 if platform == 'android':
     from android.permissions import request_permissions, Permission
@@ -43,13 +49,6 @@ if platform == 'android':
         Permission.INTERNET
     ])
 
-# PDF processing
-try:
-    from pdfminer.high_level import extract_text
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-
 # TTS for non-Android platforms
 try:
     import pyttsx3
@@ -68,9 +67,15 @@ class PDFToSpeechApp(App):
         self.output_dir = None
         self.tts_engine = None
         self.voices = []
+        self._voice_by_name = {"Default": None}
         self.current_voice = 0
         self.speech_rate = 175
         self.volume = 1.0
+        self.tts_executor = None
+        self._pool_engine = None
+        self._tts_local = threading.local()
+        self._pending_outputs = []
+        self._converting = False
         
         # Set up output directory
         if platform == 'android':
@@ -80,6 +85,14 @@ class PDFToSpeechApp(App):
         
         self.output_dir.mkdir(exist_ok=True)
         
+        # Extracted text cache
+        self.cache_ttl_secs = DEFAULT_CACHE_TTL_SECS
+        self.page_cache = PageCache(self.output_dir / ".cache", self.cache_ttl_secs)
+        
+        # Synthesized audio cache, keyed by chunk text and voice settings
+        self.tts_cache_dir = self.output_dir / ".tts_cache"
+        self.tts_cache_dir.mkdir(exist_ok=True)
+        
         # Initialize TTS
         self.init_tts()
         
@@ -177,12 +190,63 @@ class PDFToSpeechApp(App):
     def init_pyttsx3_tts(self):
         """Initialize pyttsx3 TTS"""
         try:
+            # This engine lists the voices; synthesis happens on the pool
             self.tts_engine = pyttsx3.init()
             self.load_pyttsx3_voices()
+            self.init_pyttsx3_pool()
         except Exception as e:
             LOG.error(f"Failed to initialize pyttsx3 TTS: {e}")
             self.show_error("Failed to initialize TTS")
     
+    def init_pyttsx3_pool(self):
+        """Start the threads that synthesize pages, one pyttsx3 engine each"""
+        # SAPI5 and NSSpeechSynthesizer support several synthesizers at once;
+        # eSpeak's synth callback is process-global, so other platforms
+        # hand the one engine that already exists to a single pool thread
+        if sys.platform in ('win32', 'darwin'):
+            size = min(4, os.cpu_count() or 1)
+            self._pool_engine = None
+            # Only needed for the voice list; the pool makes its own
+            self.tts_engine.stop()
+        else:
+            size = 1
+            self._pool_engine = self.tts_engine
+        
+        self.tts_executor = ThreadPoolExecutor(
+            max_workers=size, initializer=self._init_thread_engine
+        )
+    
+    def _init_thread_engine(self):
+        """Create the calling pool thread's own pyttsx3 engine"""
+        # SAPI5 needs COM initialized on the thread that drives it, and
+        # NSSpeechSynthesizer calls back on its creating thread's run loop,
+        # so each engine is built and run on the same thread
+        if sys.platform == 'win32':
+            import comtypes
+            comtypes.CoInitialize()
+        # pyttsx3.init() returns one engine shared by every thread; eSpeak
+        # has no thread affinity, so its single engine is reused as is
+        engine = self._pool_engine or pyttsx3.Engine()
+        self._tts_local.engine = engine
+        self._tts_local.settings = {}
+        # Restored when "Default" is selected again
+        self._tts_local.default_voice = engine.getProperty('voice')
+    
+    def _thread_engine(self):
+        """This thread's engine, with the current voice settings applied"""
+        local = self._tts_local
+        voice = self._voice_by_name.get(self.current_voice)
+        settings = {
+            'voice': voice.id if voice is not None else local.default_voice,
+            'rate': self.speech_rate,
+            'volume': self.volume,
+        }
+        for name, value in settings.items():
+            if value is not None and local.settings.get(name) != value:
+                local.engine.setProperty(name, value)
+                local.settings[name] = value
+        return local.engine
+    
     def load_android_voices(self):
         """Load available Android voices"""
         self.voices = ["Default"]
@@ -193,9 +257,11 @@ class PDFToSpeechApp(App):
         try:
             voices = self.tts_engine.getProperty('voices')
             self.voices = ["Default"]
+            self._voice_by_name = {"Default": None}
             for i, voice in enumerate(voices):
                 name = getattr(voice, 'name', f'Voice {i}')
                 self.voices.append(name)
+                self._voice_by_name[name] = voice
             self.voice_spinner.values = self.voices
         except Exception as e:
             LOG.error(f"Failed to load voices: {e}")
@@ -204,18 +270,11 @@ class PDFToSpeechApp(App):
     
     def on_voice_change(self, spinner, text):
         """Handle voice selection change"""
+        self.current_voice = text
+        # pyttsx3 pool threads apply the selection before their next batch
         if platform == 'android' and self.tts_engine:
             # Android voice selection would go here
             pass
-        elif PYTTSX3_AVAILABLE and self.tts_engine:
-            try:
-                voices = self.tts_engine.getProperty('voices')
-                if text != "Default" and voices:
-                    voice_index = self.voices.index(text) - 1
-                    if 0 <= voice_index < len(voices):
-                        self.tts_engine.setProperty('voice', voices[voice_index].id)
-            except Exception as e:
-                LOG.error(f"Failed to set voice: {e}")
     
     def on_rate_change(self, slider, value):
         """Handle speech rate change"""
@@ -226,8 +285,6 @@ class PDFToSpeechApp(App):
             # Convert WPM to Android rate (0.1 to 2.0)
             android_rate = max(0.1, min(2.0, value / 100.0))
             self.tts_engine.setSpeechRate(android_rate)
-        elif PYTTSX3_AVAILABLE and self.tts_engine:
-            self.tts_engine.setProperty('rate', self.speech_rate)
     
     def on_volume_change(self, slider, value):
         """Handle volume change"""
@@ -236,11 +293,13 @@ class PDFToSpeechApp(App):
         
         if platform == 'android' and self.tts_engine:
             self.tts_engine.setPitch(1.0)  # Android doesn't have direct volume control
-        elif PYTTSX3_AVAILABLE and self.tts_engine:
-            self.tts_engine.setProperty('volume', self.volume)
     
     def show_file_chooser(self, instance):
         """Show file chooser popup"""
+        # Imported on first use to keep app startup light
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.popup import Popup
+        
         content = BoxLayout(orientation='vertical', spacing=10)
         
         file_chooser = FileChooserListView(
@@ -286,121 +345,139 @@ class PDFToSpeechApp(App):
             self.show_error("TTS engine not available")
             return
         
-        # Start conversion in a separate thread
-        Clock.schedule_once(lambda dt: self.start_conversion(), 0.1)
+        # Runs share progress counters and output state, so only one at a time
+        if self._converting:
+            self.show_error("A conversion is already running")
+            return
+        self._converting = True
+        
+        # Start conversion in a separate thread with its own event loop
+        threading.Thread(
+            target=lambda: asyncio.run(self.start_conversion()),
+            daemon=True
+        ).start()
+    
+    def set_progress(self, value: float, text: str):
+        """Update progress widgets from the conversion thread"""
+        def update(dt):
+            self.progress_bar.value = value
+            self.progress_label.text = text
+        Clock.schedule_once(update)
+    
+    def _refresh_progress(self, dt):
+        """Render the conversion counter"""
+        done = self._done
+        if self._total:
+            self.progress_bar.value = done / self._total * 100
+        self.progress_label.text = f"Converting page {done}/{self._total}"
     
-    def start_conversion(self):
+    async def start_conversion(self):
         """Start the PDF conversion process"""
         try:
-            self.progress_label.text = "Extracting text from PDF..."
-            self.progress_bar.value = 0
+            self.set_progress(0, "Extracting text from PDF...")
             
-            # Extract text from PDF
+            # Pages are extracted lazily while earlier ones are converted
+            total_pages = await asyncio.to_thread(count_pdf_pages, self.pdf_path)
             pages = self.read_pdf_pages(self.pdf_path)
-            if not pages:
-                self.show_error("No text found in PDF")
-                return
+            self.set_progress(0, f"Converting up to {total_pages} pages...")
             
-            total_pages = len(pages)
-            self.progress_label.text = f"Converting {total_pages} pages..."
+            # Parsing and synthesis overlap: one producer feeds pages into a
+            # bounded queue and several workers synthesize them
+            queue = asyncio.Queue(maxsize=4)
+            workers = os.cpu_count() or 1
+            produced = 0
             
-            # Convert each page
-            for i, page_text in enumerate(pages):
-                if not page_text.strip():
-                    continue
-                
-                # Normalize text
-                text = self.normalize_text(page_text)
-                if not text:
-                    continue
-                
+            async def produce():
+                nonlocal produced
+                while True:
+                    page_text = await asyncio.to_thread(next, pages, None)
+                    if page_text is None:
+                        break
+                    await queue.put((produced, page_text))
+                    produced += 1
+                # The page count includes empty pages, which are never
+                # produced; now the number _done will reach is known
+                self._total = produced
+                await queue.put(None)
+            
+            async def consume():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        # Pass the end marker on to the other workers
+                        await queue.put(None)
+                        break
+                    await convert_page(*item)
+            
+            async def convert_page(i: int, text: str):
                 # Split into chunks
                 chunks = self.split_into_chunks(text)
+                if not chunks:
+                    self._done += 1
+                    return
                 
-                # Generate audio for each chunk
-                for j, chunk in enumerate(chunks):
-                    output_file = self.output_dir / f"page_{i+1:04d}_chunk_{j+1:02d}.wav"
-                    self.text_to_speech_file(chunk, output_file)
+                # Generate audio for all chunks of the page in one batch
+                batch = [
+                    (chunk, self.output_dir / f"page_{i+1:04d}_chunk_{j+1:02d}.wav")
+                    for j, chunk in enumerate(chunks)
+                ]
+                await self.text_to_speech_page(batch)
                 
-                # Update progress
-                progress = ((i + 1) / total_pages) * 100
-                self.progress_bar.value = progress
-                self.progress_label.text = f"Converting page {i+1}/{total_pages}"
+                # Count the page; the progress tick renders it
+                self._done += 1
                 
-                # Add output file to list
-                self.add_output_file(output_file)
+                # Add output file to list once it has been written
+                self.add_output_file(batch[-1][1])
+            
+            # Render progress at 10 Hz instead of on every page. Until
+            # parsing finishes the PDF's page count is the upper bound
+            self._done = 0
+            self._total = total_pages
+            self._tick = Clock.schedule_interval(self._refresh_progress, 0.1)
+            
+            # Batch placeholder file writes for the whole run
+            try:
+                with UringWriter() as self.output_writer:
+                    await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+            finally:
+                self._tick.cancel()
+                Clock.schedule_once(self._flush_output_files)
+            
+            if not produced:
+                Clock.schedule_once(lambda dt: self.show_error("No text found in PDF"))
+                return
             
-            self.progress_label.text = "Conversion complete!"
-            self.progress_bar.value = 100
+            self.set_progress(100, "Conversion complete!")
             
         except Exception as e:
             LOG.error(f"Conversion failed: {e}")
-            self.show_error(f"Conversion failed: {str(e)}")
+            message = f"Conversion failed: {str(e)}"
+            Clock.schedule_once(lambda dt: self.show_error(message))
+        finally:
+            self._converting = False
     
-    def read_pdf_pages(self, pdf_path: Path) -> List[str]:
-        """Extract text from PDF as list of pages"""
+    def read_pdf_pages(self, pdf_path: Path) -> Iterator[str]:
+        """Extract normalized text from PDF one page at a time"""
         try:
-            full_text = extract_text(str(pdf_path)) or ""
-            pages = full_text.split("\f")
-            pages = [p for p in pages if p.strip() != ""]
-            return pages
+            yield from read_pdf_pages(pdf_path, self.page_cache)
         except Exception as e:
             LOG.error(f"Failed to read PDF: {e}")
-            return []
-    
-    def normalize_text(self, txt: str) -> str:
-        """Clean up text formatting"""
-        txt = txt.replace("\r", "\n")
-        txt = re.sub(r"[ \t]+", " ", txt)
-        txt = re.sub(r"\n{3,}", "\n\n", txt)
-        txt = "\n".join(line.strip() for line in txt.splitlines())
-        return txt.strip()
     
     def split_into_chunks(self, text: str, max_chars: int = 1500) -> List[str]:
         """Split text into TTS-friendly chunks"""
-        text = text.strip()
-        if not text:
-            return []
-        
-        sentences = re.split(r"(?<=[.!?])\s+", text)
-        chunks = []
-        buf = []
-        
-        def flush_buf():
-            if buf:
-                chunks.append(" ".join(buf).strip())
-                buf.clear()
-        
-        for s in sentences:
-            s = s.strip()
-            if not s:
-                continue
-            
-            if len(s) > max_chars:
-                start = 0
-                while start < len(s):
-                    end = min(start + max_chars, len(s))
-                    chunks.append(s[start:end])
-                    start = end
-                continue
-            
-            tentative = (" ".join(buf + [s])).strip()
-            if len(tentative) <= max_chars:
-                buf.append(s)
-            else:
-                flush_buf()
-                buf.append(s)
-        
-        flush_buf()
-        return [c for c in chunks if c.strip()]
+        return split_into_chunks(text, max_chars)
     
-    def text_to_speech_file(self, text: str, output_path: Path):
-        """Convert text to speech and save to file"""
+    async def text_to_speech_page(self, batch: List[Tuple[str, Path]]):
+        """Convert a page's (text, output_path) chunks to speech files"""
         try:
             if platform == 'android':
-                self.android_tts_to_file(text, output_path)
+                for text, output_path in batch:
+                    await asyncio.to_thread(self.android_tts_to_file, text, output_path)
             elif PYTTSX3_AVAILABLE:
-                self.pyttsx3_tts_to_file(text, output_path)
+                # Each pool thread synthesizes with its own engine
+                await asyncio.get_running_loop().run_in_executor(
+                    self.tts_executor, self.pyttsx3_tts_flush, batch
+                )
         except Exception as e:
             LOG.error(f"TTS conversion failed: {e}")
     
@@ -410,28 +487,76 @@ class PDFToSpeechApp(App):
         # Android's TTS synthesis to file functionality
         LOG.info(f"Android TTS: {text[:50]}...")
         # For now, create a placeholder file
-        output_path.write_text("Audio placeholder")
+        self.output_writer.write(output_path, b"Audio placeholder")
+    
+    def pyttsx3_tts_enqueue(self, engine, text: str, output_path: Path):
+        """Queue pyttsx3 TTS to file; written by the next runAndWait"""
+        engine.save_to_file(text, str(output_path))
+    
+    def tts_cache_path(self, text: str) -> Path:
+        """Cached audio location for text with the current voice settings"""
+        key = f"{self.current_voice}|{self.speech_rate}|{self.volume}|{text}"
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return self.tts_cache_dir / f"{digest}.wav"
     
-    def pyttsx3_tts_to_file(self, text: str, output_path: Path):
-        """pyttsx3 TTS to file"""
+    def pyttsx3_tts_flush(self, batch: List[Tuple[str, Path]]):
+        """Queue a whole batch on this thread's engine and run it once"""
+        engine = self._thread_engine()
+        
+        # Only synthesize chunks that are not cached yet; repeated text
+        # (headers, footers, boilerplate) is rendered once
+        cached = [(self.tts_cache_path(text), output_path) for text, output_path in batch]
+        missing = {}
+        for (text, _), (cache_path, _) in zip(batch, cached):
+            if not cache_path.exists():
+                # Render to a per-thread temp file so pooled engines never
+                # write the same cache entry at once
+                tmp_path = cache_path.with_suffix(f".{threading.get_ident()}.tmp.wav")
+                missing[cache_path] = (text, tmp_path)
+        
         try:
-            self.tts_engine.save_to_file(text, str(output_path))
-            self.tts_engine.runAndWait()
+            if missing:
+                for text, tmp_path in missing.values():
+                    self.pyttsx3_tts_enqueue(engine, text, tmp_path)
+                engine.runAndWait()
+                for cache_path, (_, tmp_path) in missing.items():
+                    # Never cache empty or partial output from a failed run
+                    if tmp_path.exists() and tmp_path.stat().st_size > 0:
+                        os.replace(tmp_path, cache_path)
+                    else:
+                        LOG.error(f"pyttsx3 produced no audio for {cache_path.name}")
+                        try:
+                            tmp_path.unlink()
+                        except FileNotFoundError:
+                            pass
+            
+            for cache_path, output_path in cached:
+                if cache_path.exists():
+                    link_or_copy(cache_path, output_path)
         except Exception as e:
             LOG.error(f"pyttsx3 TTS failed: {e}")
     
     def add_output_file(self, file_path: Path):
-        """Add output file to the list"""
-        btn = Button(
-            text=file_path.name,
-            size_hint_y=None,
-            height=40
-        )
-        btn.bind(on_press=lambda x: self.play_audio(file_path))
-        self.output_list.add_widget(btn)
+        """Queue an output file for the list; shown when conversion ends"""
+        self._pending_outputs.append(file_path)
+    
+    def _flush_output_files(self, dt):
+        """Add all queued output files to the list in one pass"""
+        pending = sorted(self._pending_outputs)
+        self._pending_outputs.clear()
+        for file_path in pending:
+            btn = Button(
+                text=file_path.name,
+                size_hint_y=None,
+                height=40
+            )
+            btn.bind(on_press=lambda x, p=file_path: self.play_audio(p))
+            self.output_list.add_widget(btn)
     
     def play_audio(self, file_path: Path):
         """Play audio file"""
+        from kivy.core.audio import SoundLoader
+        
         try:
             if file_path.exists():
                 sound = SoundLoader.load(str(file_path))
@@ -442,6 +567,8 @@ class PDFToSpeechApp(App):
     
     def show_error(self, message: str):
         """Show error popup"""
+        from kivy.uix.popup import Popup
+        
         content = BoxLayout(orientation='vertical', spacing=10)
         content.add_widget(Label(text=message))
         close_btn = Button(text='Close', size_hint_y=None, height=50)
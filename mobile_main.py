@@ -8,17 +8,16 @@ import os
 import sys
 import json
 import logging
-import re
 import time
 from pathlib import Path
-from typing import List
 
-# PDF processing
-try:
-    from pdfminer.high_level import extract_text
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+# PDF text extraction and TTS helpers (shared with the desktop apps)
+from pdf_tts_core import (
+    PDF_AVAILABLE, count_pdf_pages, init_tts_engine, read_pdf_pages,
+    split_into_chunks
+)
+
+if not PDF_AVAILABLE:
     print("PDF processing not available. Install with: pip install pdfminer.six")
 
 # TTS
@@ -35,7 +34,12 @@ LOG = logging.getLogger("pdf_tts_mobile")
 
 def get_pdf_files():
     """Get list of PDF files in current directory"""
-    pdf_files = list(Path('.').glob('*.pdf'))
+    # scandir's entries carry the name and file type, so no per-file stat
+    with os.scandir('.') as entries:
+        pdf_files = [
+            Path(e.name) for e in entries
+            if e.name.lower().endswith('.pdf') and e.is_file()
+        ]
     if not pdf_files:
         print("No PDF files found in current directory.")
         print("Please copy PDF files to this directory first.")
@@ -66,96 +70,6 @@ def select_pdf():
             print("\nExiting...")
             sys.exit(0)
 
-def read_pdf_pages(pdf_path: Path) -> List[str]:
-    """Extract text from PDF as list of pages"""
-    if not PDF_AVAILABLE:
-        print("PDF processing not available!")
-        return []
-    
-    print(f"Extracting text from {pdf_path.name}...")
-    try:
-        full_text = extract_text(str(pdf_path)) or ""
-        pages = full_text.split("\f")
-        pages = [p for p in pages if p.strip() != ""]
-        print(f"Found {len(pages)} pages of text.")
-        return pages
-    except Exception as e:
-        print(f"Error reading PDF: {e}")
-        return []
-
-def normalize_text(txt: str) -> str:
-    """Clean up text formatting"""
-    txt = txt.replace("\r", "\n")
-    txt = re.sub(r"[ \t]+", " ", txt)
-    txt = re.sub(r"\n{3,}", "\n\n", txt)
-    txt = "\n".join(line.strip() for line in txt.splitlines())
-    return txt.strip()
-
-def split_into_chunks(text: str, max_chars: int = 1000) -> List[str]:
-    """Split text into TTS-friendly chunks"""
-    text = text.strip()
-    if not text:
-        return []
-    
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    chunks = []
-    buf = []
-    
-    def flush_buf():
-        if buf:
-            chunks.append(" ".join(buf).strip())
-            buf.clear()
-    
-    for s in sentences:
-        s = s.strip()
-        if not s:
-            continue
-        
-        if len(s) > max_chars:
-            start = 0
-            while start < len(s):
-                end = min(start + max_chars, len(s))
-                chunks.append(s[start:end])
-                start = end
-            continue
-        
-        tentative = (" ".join(buf + [s])).strip()
-        if len(tentative) <= max_chars:
-            buf.append(s)
-        else:
-            flush_buf()
-            buf.append(s)
-    
-    flush_buf()
-    return [c for c in chunks if c.strip()]
-
-def init_tts_engine():
-    """Initialize TTS engine"""
-    if not TTS_AVAILABLE:
-        print("TTS not available!")
-        return None
-    
-    try:
-        engine = pyttsx3.init()
-        voices = engine.getProperty('voices')
-        
-        print(f"Available voices: {len(voices)}")
-        for i, voice in enumerate(voices):
-            name = getattr(voice, 'name', f'Voice {i}')
-            print(f"  {i}: {name}")
-        
-        # Set default voice
-        if voices:
-            engine.setProperty('voice', voices[0].id)
-        
-        engine.setProperty('rate', 175)
-        engine.setProperty('volume', 1.0)
-        
-        return engine
-    except Exception as e:
-        print(f"Error initializing TTS: {e}")
-        return None
-
 def save_text_to_file(text: str, output_path: Path):
     """Save text to file (fallback when TTS is not available)"""
     try:
@@ -169,47 +83,56 @@ def convert_pdf_to_speech(pdf_path: Path, output_dir: Path):
     output_dir.mkdir(exist_ok=True)
     
     # Initialize TTS
-    engine = init_tts_engine()
+    engine = None
+    if not TTS_AVAILABLE:
+        print("TTS not available!")
+    else:
+        try:
+            engine = init_tts_engine(voice_index=0, rate=175, volume=1.0)
+        except Exception as e:
+            print(f"Error initializing TTS: {e}")
     
-    # Extract pages
-    pages = read_pdf_pages(pdf_path)
-    if not pages:
-        print("No text found in PDF.")
+    # Pages are extracted as the loop consumes them (already normalized,
+    # empty pages dropped), so only one page is held at a time
+    print(f"Extracting text from {pdf_path.name}...")
+    try:
+        total = count_pdf_pages(pdf_path)
+    except Exception as e:
+        print(f"Error reading PDF: {e}")
         return
     
-    print(f"\nConverting {len(pages)} pages...")
+    print(f"\nConverting up to {total} pages (empty pages are skipped)...")
     
-    for i, page_text in enumerate(pages, 1):
-        if not page_text.strip():
-            continue
-        
-        print(f"Processing page {i}/{len(pages)}...")
-        
-        # Normalize text
-        text = normalize_text(page_text)
-        if not text:
-            continue
+    # Output paths are built as plain strings; save_to_file takes a str
+    outdir_prefix = os.fspath(output_dir) + os.sep
+    
+    converted = 0
+    for i, text in enumerate(read_pdf_pages(pdf_path), 1):
+        converted = i
+        print(f"Processing page {i} of at most {total}...")
         
         # Split into chunks
-        chunks = split_into_chunks(text)
+        chunks = split_into_chunks(text, max_chars=1000)
         
         # Save each chunk
-        for j, chunk in enumerate(chunks):
+        for j, chunk in enumerate(chunks, 1):
+            name = "page_%04d_chunk_%02d" % (i, j)
             if engine:
                 # Try to generate audio
                 try:
-                    output_file = output_dir / f"page_{i:04d}_chunk_{j+1:02d}.wav"
-                    engine.save_to_file(chunk, str(output_file))
+                    engine.save_to_file(chunk, outdir_prefix + name + ".wav")
                     engine.runAndWait()
-                    print(f"  Audio saved: {output_file.name}")
+                    print(f"  Audio saved: {name}.wav")
                 except Exception as e:
                     print(f"  TTS failed, saving as text: {e}")
-                    output_file = output_dir / f"page_{i:04d}_chunk_{j+1:02d}.txt"
-                    save_text_to_file(chunk, output_file)
+                    save_text_to_file(chunk, Path(outdir_prefix + name + ".txt"))
             else:
                 # Save as text file
-                output_file = output_dir / f"page_{i:04d}_chunk_{j+1:02d}.txt"
-                save_text_to_file(chunk, output_file)
+                save_text_to_file(chunk, Path(outdir_prefix + name + ".txt"))
+    
+    if not converted:
+        print("No text found in PDF.")
+        return
     
     print(f"\nConversion complete! Files saved in: {output_dir}")
 
@@ -1,19 +1,48 @@
 # pdf_to_speech.py
 import argparse
+import hashlib
+import io
+import itertools
 import json
 import logging
+import multiprocessing
 import os
-import re
+import queue
+import shutil
+import struct
+import subprocess
 import sys
+import threading
 import time
+import wave
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import List
 
-# --- PDF text extraction ---
-from pdfminer.high_level import extract_text
-
-# --- TTS ---
-import pyttsx3
+# orjson serializes checkpoints in C; optional
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+# soundfile (libsndfile) encodes FLAC output; optional
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except ImportError:
+    SOUNDFILE_AVAILABLE = False
+
+# --- PDF text extraction and TTS helpers (shared with the GUI apps) ---
+from pdf_tts_core import (
+    UringWriter, init_tts_engine, link_or_copy, read_pdf_pages,
+    split_into_chunks
+)
 
 # ----------------- Logging -----------------
 logging.basicConfig(
@@ -23,130 +52,193 @@ logging.basicConfig(
 )
 LOG = logging.getLogger("pdf_tts")
 
-# ----------------- Helpers -----------------
-def read_pdf_pages(pdf_path: Path) -> List[str]:
-    """
-    Extract text from a PDF as a list of pages.
-    Uses pdfminer.six; page breaks appear as '\f'.
-    """
-    LOG.info("Extracting text from PDF (this may take a while for large files)…")
-    full_text = extract_text(str(pdf_path)) or ""
-    # Split on form-feed (page separator in pdfminer output)
-    pages = full_text.split("\f")
-    # Remove trailing empties
-    pages = [p for p in pages if p.strip() != ""]
-    LOG.info("Found %d non-empty pages of text.", len(pages))
-    return pages
-
-def normalize_text(txt: str) -> str:
-    """
-    Clean up spacing; preserve paragraph breaks reasonably.
-    """
-    # Replace multiple spaces/newlines with single equivalents
-    txt = txt.replace("\r", "\n")
-    txt = re.sub(r"[ \t]+", " ", txt)
-    # Collapse 3+ newlines into 2 to keep paragraph feel
-    txt = re.sub(r"\n{3,}", "\n\n", txt)
-    # Trim lines
-    txt = "\n".join(line.strip() for line in txt.splitlines())
-    return txt.strip()
-
-def split_into_chunks(text: str, max_chars: int = 1500) -> List[str]:
-    """
-    Split text into chunks that are small enough for TTS engines.
-    Prefer sentence boundaries, then fall back to character chunks.
-    """
-    text = text.strip()
-    if not text:
-        return []
-
-    # First, split by sentences (rough)
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    chunks = []
-    buf = []
-
-    def flush_buf():
-        if buf:
-            chunks.append(" ".join(buf).strip())
-            buf.clear()
-
-    for s in sentences:
-        s = s.strip()
-        if not s:
-            continue
-        # If a single sentence is huge, hard-split it
-        if len(s) > max_chars:
-            # Split by commas/spaces without exceeding max_chars
-            start = 0
-            while start < len(s):
-                end = min(start + max_chars, len(s))
-                chunks.append(s[start:end])
-                start = end
-            continue
-
-        # Try to append to buffer
-        tentative = (" ".join(buf + [s])).strip()
-        if len(tentative) <= max_chars:
-            buf.append(s)
-        else:
-            flush_buf()
-            buf.append(s)
-
-    flush_buf()
-    return [c for c in chunks if c.strip()]
-
-def init_tts_engine(voice_index: int = None, rate: int = None, volume: float = 1.0):
-    engine = pyttsx3.init()  # SAPI5 on Windows, NSSpeechSynth on macOS, eSpeak on Linux
-    voices = engine.getProperty("voices")
-
-    # Print available voices (once)
-    LOG.info("Available voices:")
-    for i, v in enumerate(voices):
-        LOG.info("  [%d] name=%s | id=%s | lang=%s", i, getattr(v, "name", "?"), getattr(v, "id", "?"), getattr(v, "languages", "?"))
-
-    if voice_index is not None:
+# ----------------- TTS -----------------
+def _remove_partial(out_wav: Path):
+    # Remove existing partial file if any
+    if out_wav.exists():
         try:
-            engine.setProperty("voice", voices[voice_index].id)
-        except Exception as e:
-            LOG.warning("Could not set voice index %s (%s). Using default.", voice_index, e)
-
-    if rate is not None:
-        engine.setProperty("rate", int(rate))
-
-    if volume is not None:
-        engine.setProperty("volume", float(volume))
-
-    return engine
-
-def tts_save(engine, text: str, out_wav: Path, retries: int = 3, sleep_sec: float = 1.0):
+            out_wav.unlink()
+        except Exception:
+            pass
+
+def tts_save(
+    engine,
+    text: str,
+    out_wav: Path,
+    retries: int = 3,
+    sleep_sec: float = 1.0,
+    reinit_after: int = 2,
+    queue_only: bool = False,
+    voice_index: int = None,
+    rate: int = None,
+    label: str = None,
+):
     """
     Save TTS to a WAV file with retries. pyttsx3 usually outputs WAV reliably.
+    Returns the engine, which is replaced only after reinit_after
+    consecutive failures; callers should keep the returned reference.
+    A replacement engine is set up with voice_index and rate, which
+    should match the settings the original engine was created with.
+    label names the output in errors (defaults to the file name).
+    With queue_only, the utterance is only queued: the caller runs
+    engine.runAndWait() once for the batch and checks the outputs itself.
     """
+    if queue_only:
+        _remove_partial(out_wav)
+        engine.save_to_file(text, str(out_wav))
+        return engine
+
     for attempt in range(1, retries + 1):
         try:
-            # Remove existing partial file if any
-            if out_wav.exists():
-                try:
-                    out_wav.unlink()
-                except Exception:
-                    pass
+            _remove_partial(out_wav)
             engine.save_to_file(text, str(out_wav))
             engine.runAndWait()
             if out_wav.exists() and out_wav.stat().st_size > 0:
-                return
+                return engine
             raise RuntimeError("No output or zero-byte file.")
         except Exception as e:
             LOG.warning("TTS save failed (attempt %d/%d): %s", attempt, retries, e)
             time.sleep(sleep_sec)
-            # Re-initialize the engine on the next attempt to avoid bad state
-            if attempt < retries:
+            if attempt >= retries:
+                break
+            if attempt % reinit_after:
+                # Usually enough is to end a run loop left behind by the
+                # failed runAndWait
+                try:
+                    engine.endLoop()
+                except Exception:
+                    pass
+            else:
+                # Re-initialize the engine to get out of a persistent bad state
                 engine.stop()
-                engine = init_tts_engine(
-                    voice_index=None,  # keep default on re-init; safer
-                    rate=None,
-                    volume=1.0,
+                engine = init_tts_engine(voice_index=voice_index, rate=rate, volume=1.0)
+    raise RuntimeError(f"TTS failed after {retries} attempts for {label or out_wav.name}")
+
+# ----------------- Parallel rendering -----------------
+# Each worker process owns its own pyttsx3 engine. Its settings are kept
+# so a re-initialized engine renders with the same voice and rate, which
+# the chunk cache keys assume
+_WORKER_ENGINE = None
+_WORKER_SETTINGS = {}
+
+def _worker_init(voice_index: int = None, rate: int = None):
+    global _WORKER_ENGINE
+    _WORKER_SETTINGS.update(voice_index=voice_index, rate=rate)
+    _WORKER_ENGINE = init_tts_engine(voice_index=voice_index, rate=rate, volume=1.0)
+
+def _worker_render(jobs):
+    """
+    Render one page's (text, out_wav, cache_wav) chunks with a single
+    runAndWait. Returns the output paths.
+    """
+    global _WORKER_ENGINE
+    # Synthesize only chunks that have not been rendered before, e.g. by
+    # an interrupted run; other workers may race on the same text, so
+    # render to private names and move them into place
+    missing = [
+        (text, out_wav, cache_wav, cache_wav.with_suffix(f".{os.getpid()}.tmp.wav"))
+        for text, out_wav, cache_wav in jobs
+        if not cache_wav.exists()
+    ]
+    if missing:
+        for text, _, _, tmp_wav in missing:
+            _WORKER_ENGINE = tts_save(_WORKER_ENGINE, text, tmp_wav, queue_only=True)
+        try:
+            _WORKER_ENGINE.runAndWait()
+        except Exception as e:
+            LOG.warning("Batched TTS run failed, retrying chunks one by one: %s", e)
+        for text, out_wav, cache_wav, tmp_wav in missing:
+            if not (tmp_wav.exists() and tmp_wav.stat().st_size > 0):
+                _WORKER_ENGINE = tts_save(
+                    _WORKER_ENGINE, text, tmp_wav,
+                    label=os.path.basename(out_wav), **_WORKER_SETTINGS
                 )
-    raise RuntimeError(f"TTS failed after {retries} attempts for {out_wav.name}")
+            os.replace(tmp_wav, cache_wav)
+
+    for _, out_wav, cache_wav in jobs:
+        link_or_copy(cache_wav, out_wav)
+    return [out_wav for _, out_wav, _ in jobs]
+
+def chunk_cache_path(cache_dir: Path, text: str, voice=None, rate: int = None) -> Path:
+    """
+    Content-addressed WAV location for a chunk; the voice settings are
+    part of the key so changing them never reuses stale audio.
+    """
+    key = f"{voice}|{rate}|{text}".encode()
+    return cache_dir / f"{hashlib.blake2b(key, digest_size=8).hexdigest()}.wav"
+
+# ----------------- Piper backend -----------------
+class PiperBackend:
+    """
+    Piper neural TTS (https://github.com/rhasspy/piper), run once per page.
+    Each chunk is fed as one stdin line and the raw 16-bit mono PCM that
+    Piper streams back is wrapped into a single WAV, or encoded straight
+    to FLAC.
+    """
+
+    def __init__(self, model: str, rate: int = None, executable: str = "piper"):
+        exe = shutil.which(executable)
+        if exe is None:
+            raise RuntimeError(f"Piper executable not found: {executable}")
+        if not Path(model).exists():
+            raise RuntimeError(f"Piper model not found: {model}")
+        self.model = model
+        self.sample_rate = self._model_sample_rate(model)
+        self.cmd = [exe, "--model", model, "--output_raw"]
+        if rate:
+            # Piper has no words-per-minute setting; scale its phoneme
+            # length relative to pyttsx3's default rate instead
+            self.cmd += ["--length_scale", f"{175 / rate:.3f}"]
+
+    @staticmethod
+    def _model_sample_rate(model: str) -> int:
+        # Voices ship with a <model>.json config next to the .onnx file
+        try:
+            with open(model + ".json", encoding="utf-8") as fh:
+                return int(json.load(fh)["audio"]["sample_rate"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 22050
+
+    def synthesize_page(self, chunks: List[str], audio_format: str = "wav") -> bytes:
+        # Piper speaks one utterance per input line
+        lines = "".join(c.replace("\n", " ") + "\n" for c in chunks)
+        proc = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        pcm, err = proc.communicate(lines.encode("utf-8"))
+        if proc.returncode != 0 or not pcm:
+            msg = err.decode("utf-8", "replace").strip().splitlines()
+            raise RuntimeError(f"Piper failed ({proc.returncode}): {msg[-1] if msg else 'no output'}")
+
+        buf = io.BytesIO()
+        if audio_format == "flac":
+            with soundfile.SoundFile(
+                buf, "w", self.sample_rate, 1, "PCM_16", format="FLAC"
+            ) as f:
+                f.buffer_write(pcm, dtype="int16")
+            return buf.getvalue()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(pcm)
+        return buf.getvalue()
+
+# Temp names for Piper output; unique even for one thread's pending writes
+_PIPER_TMP_IDS = itertools.count()
+
+def _piper_render(backend: PiperBackend, chunks: List[str], cache_path: Path, writer: UringWriter):
+    """
+    Synthesize a page unless it is cached, queueing the audio on writer
+    in cache_path's format. Returns the temp path to move into the cache
+    once writer is flushed.
+    """
+    if cache_path.exists():
+        return None
+    audio_format = cache_path.suffix[1:]
+    tmp_path = cache_path.with_suffix(f".{next(_PIPER_TMP_IDS)}.tmp.{audio_format}")
+    writer.write(tmp_path, backend.synthesize_page(chunks, audio_format))
+    return tmp_path
 
 # ----------------- Checkpointing -----------------
 def load_checkpoint(path: Path):
@@ -158,7 +250,11 @@ def load_checkpoint(path: Path):
     return {"completed_pages": []}
 
 def save_checkpoint(path: Path, data):
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Write beside the checkpoint and swap it in, so an interrupted write
+    # never leaves a truncated progress.json behind
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_bytes(_dumps(data))
+    os.replace(tmp, path)
 
 
 # ----------------- Main conversion -----------------
@@ -169,98 +265,317 @@ def convert_pdf_to_speech(
     rate: int = 175,
     page_prefix: str = "page",
     max_chunk_chars: int = 1500,
+    engine: str = "pyttsx3",
+    piper_model: str = None,
+    audio_format: str = "wav",
 ):
-    outdir.mkdir(parents=True, exist_ok=True)
-    checkpoint_path = outdir / "progress.json"
-
+    # Pages are parsed lazily as the loop below consumes them; they come
+    # back normalized, with empty pages already dropped. Without pypdfium2
+    # a large PDF is parsed by up to cpu_count pdfminer processes, which
+    # run alongside the cpu_count TTS workers below
     pages = read_pdf_pages(pdf_path)
-    if not pages:
+
+    # Parse up to the first page with text before setting anything up, so
+    # a document without any never starts workers or touches outdir
+    first_page = next(pages, None)
+    if first_page is None:
         LOG.error("No extractable text found in PDF.")
         sys.exit(2)
+    pages = itertools.chain([first_page], pages)
+
+    outdir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = outdir / "progress.json"
+    cache_dir = outdir / ".cache"
+    cache_dir.mkdir(exist_ok=True)
 
     ckpt = load_checkpoint(checkpoint_path)
     done_pages = set(ckpt.get("completed_pages", []))
 
-    engine = init_tts_engine(voice_index=voice_index, rate=rate, volume=1.0)
-
-    for p_idx, raw_text in enumerate(pages, start=1):
-        if p_idx in done_pages:
-            LOG.info("Skipping page %d (already completed).", p_idx)
-            continue
-
-        text = normalize_text(raw_text)
-        if not text:
-            LOG.info("Page %d empty after cleaning — marking done.", p_idx)
-            done_pages.add(p_idx)
-            save_checkpoint(checkpoint_path, {"completed_pages": sorted(done_pages)})
-            continue
-
-        chunks = split_into_chunks(text, max_chars=max_chunk_chars)
-        LOG.info("Page %d: %d chunk(s).", p_idx, len(chunks))
-
-        if len(chunks) == 0:
-            LOG.info("Page %d has no speakable text — marking done.", p_idx)
-            done_pages.add(p_idx)
-            save_checkpoint(checkpoint_path, {"completed_pages": sorted(done_pages)})
-            continue
-
-        # Produce one WAV per page; concatenate outside if you like
-        page_wav = outdir / f"{page_prefix}_{p_idx:04d}.wav"
-
-        # If page has multiple chunks, render to temp files and then concatenate WAVs
-        if len(chunks) == 1:
-            LOG.info("Rendering page %d → %s", p_idx, page_wav.name)
-            tts_save(engine, chunks[0], page_wav)
-        else:
-            LOG.info("Rendering page %d in %d parts…", p_idx, len(chunks))
-            for i, chunk in enumerate(chunks, start=1):
-                part = outdir / f"{page_prefix}_{p_idx:04d}_part_{i:02d}.wav"
-                tts_save(engine, chunk, part)
-
+    # Render chunks in worker processes, one pyttsx3 engine each. Piper
+    # runs as its own process per page, so threads are enough to drive it
+    workers = os.cpu_count() or 1
+    if engine == "piper":
+        piper = PiperBackend(piper_model, rate=rate)
+        pool = ThreadPoolExecutor(max_workers=workers)
+        # Piper pages are bytes held by Python; the threads queue them and
+        # the page writer submits everything queued so far in one batch
+        # (via io_uring when liburing is installed)
+        piper_writer = UringWriter()
+    else:
+        piper = None
+        piper_writer = None
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # The page writer thread is already running when workers start
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(voice_index, rate),
+        )
 
-                # Mark page done
-                done_pages.add(p_idx)
+    # Submitted pages go through a bounded queue to a writer thread that
+    # waits for their chunks, joins multi-part pages into one WAV and
+    # checkpoints them. The bound keeps parsing from running far ahead
+    # of rendering while giving every worker something to do
+    finished = queue.Queue(maxsize=2 * workers)
+    errors = []
+
+    # Cache entries are only kept while a page that uses them is in
+    # flight, so finished pages don't leave a second, uncompressed copy
+    # of their audio behind. Repeated text shared by pages in flight
+    # still renders once
+    cache_refs = Counter()
+    cache_lock = threading.Lock()
+
+    def release_cache(cache_wavs):
+        with cache_lock:
+            for cache_wav in cache_wavs:
+                cache_refs[cache_wav] -= 1
+                if cache_refs[cache_wav] <= 0:
+                    del cache_refs[cache_wav]
+                    try:
+                        cache_wav.unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def page_writer():
+        while True:
+            item = finished.get()
+            if item is None:
+                return
+            if errors:
+                continue  # keep draining so the producer never blocks
+            page_idx, futures, parts, page_wav, cache_wavs, finish = item
+            try:
+                # re-raise TTS failures
+                results = [future.result() for future in futures]
+                if finish is not None:
+                    finish(*results)
+                if parts:
+                    concat_wavs(parts, page_wav)
+                    for part in parts:
+                        os.unlink(part)
+                if page_wav is not None and audio_format == "flac":
+                    wav_to_flac(page_wav, page_wav.with_suffix(".flac"))
+                    page_wav.unlink()
+                done_pages.add(page_idx)
                 save_checkpoint(checkpoint_path, {"completed_pages": sorted(done_pages)})
+                release_cache(cache_wavs)
+            except Exception as e:
+                err = RuntimeError(f"Page {page_idx}: {e}")
+                err.__cause__ = e
+                errors.append(err)
+            except BaseException as e:
+                # KeyboardInterrupt re-raised from a worker that got the
+                # terminal's SIGINT; record it and keep draining
+                errors.append(e)
+
+    def finish_piper(tmp_path, cache_path: Path, page_path: Path):
+        if tmp_path is not None:
+            # Lands this page and whatever other Piper threads queued
+            piper_writer.flush()
+            os.replace(tmp_path, cache_path)
+        link_or_copy(cache_path, page_path)
+
+    writer = threading.Thread(target=page_writer, daemon=True)
+    writer.start()
+
+    def hand_off(item) -> bool:
+        # Never block for good on a full queue whose writer is gone
+        while writer.is_alive():
+            try:
+                finished.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    outdir_prefix = os.fspath(outdir) + os.sep
+    try:
+        with pool:
+            for p_idx, text in enumerate(pages, start=1):
+                if errors:
+                    break
+
+                if p_idx in done_pages:
+                    LOG.info("Skipping page %d (already completed).", p_idx)
+                    continue
+
+                chunks = split_into_chunks(text, max_chars=max_chunk_chars)
+                LOG.info("Page %d: %d chunk(s).", p_idx, len(chunks))
+
+                if len(chunks) == 0:
+                    LOG.info("Page %d has no speakable text — marking done.", p_idx)
+                    hand_off((p_idx, [], [], None, [], None))
+                    continue
+
+                # Produce one WAV per page
+                page_wav = outdir / f"{page_prefix}_{p_idx:04d}.wav"
+
+                if piper is not None:
+                    # Piper's PCM is encoded in the output format directly,
+                    # so FLAC pages never go through a WAV on disk
+                    page_path = page_wav.with_suffix("." + audio_format)
+                    LOG.info("Rendering page %d with Piper → %s", p_idx, page_path.name)
+                    cache_path = chunk_cache_path(
+                        cache_dir, "\n".join(chunks), piper.model, rate
+                    ).with_suffix(page_path.suffix)
+                    with cache_lock:
+                        cache_refs[cache_path] += 1
+                    future = pool.submit(_piper_render, piper, chunks, cache_path, piper_writer)
+                    finish = partial(finish_piper, cache_path=cache_path, page_path=page_path)
+                    hand_off((p_idx, [future], [], None, [cache_path], finish))
+                    continue
+
+                # If page has multiple chunks, render to temp files and then concatenate WAVs
+                if len(chunks) == 1:
+                    LOG.info("Rendering page %d → %s", p_idx, page_wav.name)
+                    parts = []
+                    jobs = [(chunks[0], page_wav)]
+                else:
+                    LOG.info("Rendering page %d in %d parts…", p_idx, len(chunks))
+                    # Part paths are plain strings; they are only opened,
+                    # linked and unlinked, so no Path objects are needed
+                    part_prefix = "%s%s_%04d_part_" % (outdir_prefix, page_prefix, p_idx)
+                    parts = ["%s%02d.wav" % (part_prefix, i) for i in range(1, len(chunks) + 1)]
+                    jobs = list(zip(chunks, parts))
+                # One task per page, so the worker queues every chunk and
+                # drives the engine's event loop once
+                jobs = [
+                    (chunk, out_wav, chunk_cache_path(cache_dir, chunk, voice_index, rate))
+                    for chunk, out_wav in jobs
+                ]
+                cache_wavs = [cache_wav for _, _, cache_wav in jobs]
+                with cache_lock:
+                    cache_refs.update(cache_wavs)
+                future = pool.submit(_worker_render, jobs)
+                hand_off((p_idx, [future], parts, page_wav, cache_wavs, None))
+    finally:
+        hand_off(None)
+        writer.join()
+        if piper_writer is not None:
+            piper_writer.close()
+
+    if errors:
+        raise errors[0]
+
+    # The book is complete; drop anything an interrupted run left behind
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    LOG.info("All done! %s files saved in: %s", audio_format.upper(), outdir.resolve())
+
+
+def _wav_data_chunk(fh):
+    """
+    Walk the RIFF chunks of an open WAV file.
+    Returns (fmt chunk payload, data payload offset, data payload size).
+    """
+    riff = fh.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise RuntimeError(f"Not a WAV file: {fh.name}")
+    fmt = None
+    while True:
+        header = fh.read(8)
+        if len(header) < 8:
+            raise RuntimeError(f"No data chunk in {fh.name}")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"data":
+            if fmt is None:
+                raise RuntimeError(f"No fmt chunk in {fh.name}")
+            return fmt, fh.tell(), size
+        if chunk_id == b"fmt ":
+            fmt = fh.read(size)
+            fh.seek(size & 1, os.SEEK_CUR)
+        else:
+            # Chunks are word-aligned
+            fh.seek(size + (size & 1), os.SEEK_CUR)
 
-            LOG.info("All done! WAV files saved in: %s", outdir.resolve())
+# Only Linux sendfile accepts a regular file as the destination; macOS
+# and the BSDs require a socket
+_FILE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
 
+def _copy_range(in_fh, out_fh, offset: int, count: int):
+    """Copy count bytes from offset in in_fh to the current end of out_fh"""
+    if _FILE_SENDFILE:
+        in_fd, out_fd = in_fh.fileno(), out_fh.fileno()
+        try:
+            while count > 0:
+                sent = os.sendfile(out_fd, in_fd, offset, count)
+                if sent == 0:
+                    raise RuntimeError(f"Unexpected end of {in_fh.name}")
+                offset += sent
+                count -= sent
+            return
+        except OSError as e:
+            # e.g. a filesystem without splice support; copy what is left
+            LOG.debug("sendfile failed (%s); falling back to read/write", e)
+
+    in_fh.seek(offset)
+    while count > 0:
+        buf = in_fh.read(min(count, 1 << 20))
+        if not buf:
+            raise RuntimeError(f"Unexpected end of {in_fh.name}")
+        out_fh.write(buf)
+        count -= len(buf)
 
 def concat_wavs(parts: List[Path], out_path: Path):
     """
-    Concatenate WAV files with native wave module (no ffmpeg dependency).
+    Concatenate WAV files without decoding them (no ffmpeg dependency).
+    Sample data is copied in-kernel with sendfile where available.
     Assumes all inputs share the same audio params (pyttsx3 produces consistent params).
     """
-    import wave
-
     if not parts:
         raise ValueError("No parts to concatenate.")
-    params = None
-    frames = []
 
-    for p in parts:
-        with wave.open(str(p), "rb") as w:
-            if params is None:
-                params = w.getparams()
-            else:
-                if w.getparams() != params:
-                    raise RuntimeError("Mismatched WAV params; cannot concatenate.")
-            frames.append(w.readframes(w.getnframes()))
-
-    with wave.open(str(out_path), "wb") as out:
-        out.setparams(params)
-        for fr in frames:
-            out.writeframes(fr)
+    files = [open(p, "rb") for p in parts]
+    try:
+        chunks = [_wav_data_chunk(fh) for fh in files]
+        fmt = chunks[0][0]
+        # Parts differ in length; only the audio format must match
+        if any(c[0] != fmt for c in chunks):
+            raise RuntimeError("Mismatched WAV params; cannot concatenate.")
+
+        data_size = sum(size for _, _, size in chunks)
+        header = (
+            struct.pack("<4sI4s", b"RIFF", 4 + 8 + len(fmt) + 8 + data_size, b"WAVE")
+            + struct.pack("<4sI", b"fmt ", len(fmt)) + fmt
+            + struct.pack("<4sI", b"data", data_size)
+        )
+        # out_path may still be a hard link into the chunk cache from an
+        # earlier single-chunk render; writing in place would clobber that
+        tmp_path = "%s.tmp" % os.fspath(out_path)
+        with open(tmp_path, "wb") as out:
+            out.write(header)
+            out.flush()
+            for fh, (_, offset, size) in zip(files, chunks):
+                _copy_range(fh, out, offset, size)
+        os.replace(tmp_path, out_path)
+    finally:
+        for fh in files:
+            fh.close()
+
+def wav_to_flac(wav_path: Path, flac_path: Path):
+    """
+    Losslessly re-encode a 16-bit WAV as FLAC (about half the size),
+    so less audio has to be written to slow storage.
+    """
+    data, sample_rate = soundfile.read(str(wav_path), dtype="int16")
+    tmp = flac_path.with_suffix(".flac.tmp")
+    soundfile.write(str(tmp), data, sample_rate, format="FLAC", subtype="PCM_16")
+    os.replace(tmp, flac_path)
 
 # ----------------- CLI -----------------
 def parse_args():
     ap = argparse.ArgumentParser(
-        description="Convert a PDF book to speech (one WAV per page) with resume-safe checkpoints."
+        description="Convert a PDF book to speech (one WAV or FLAC per page) with resume-safe checkpoints."
     )
     ap.add_argument("pdf", type=str, help="Path to the input PDF.")
     ap.add_argument("--outdir", type=str, default="tts_output", help="Output folder for WAV files.")
     ap.add_argument("--voice", type=int, default=None, help="Voice index to use (see printed list).")
     ap.add_argument("--rate", type=int, default=175, help="Speech rate (words per minute).")
     ap.add_argument("--chunk", type=int, default=1500, help="Max characters per TTS chunk.")
+    ap.add_argument("--engine", choices=("pyttsx3", "piper"), default="pyttsx3", help="TTS engine to use.")
+    ap.add_argument("--format", choices=("wav", "flac"), default="wav", help="Output audio format (flac needs soundfile).")
+    ap.add_argument("--piper-model", type=str, default=None, help="Path to a Piper .onnx voice (with --engine piper).")
     return ap.parse_args()
 
 def main():
@@ -272,6 +587,14 @@ def main():
         LOG.error("PDF not found: %s", pdf_path)
         sys.exit(1)
 
+    if args.engine == "piper" and not args.piper_model:
+        LOG.error("--engine piper requires --piper-model.")
+        sys.exit(1)
+
+    if args.format == "flac" and not SOUNDFILE_AVAILABLE:
+        LOG.error("FLAC output needs soundfile: pip install soundfile")
+        sys.exit(1)
+
     try:
         convert_pdf_to_speech(
             pdf_path=pdf_path,
@@ -279,6 +602,9 @@ def main():
             voice_index=args.voice,
             rate=args.rate,
             max_chunk_chars=args.chunk,
+            engine=args.engine,
+            piper_model=args.piper_model,
+            audio_format=args.format,
         )
     except KeyboardInterrupt:
         LOG.warning("Interrupted by user. Progress saved; you can rerun to resume.")
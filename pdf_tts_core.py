@@ -0,0 +1,466 @@
+# pdf_tts_core.py - Shared helpers for the PDF to Speech apps
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+# PDF processing. pdfminer_cython is a drop-in build of pdfminer.six with
+# the parser loops compiled; it only has CPython 3.7+ desktop wheels, so
+# Android and other platforms fall back to pure-Python pdfminer.six
+try:
+    try:
+        from pdfminer_cython.high_level import extract_pages
+        from pdfminer_cython.layout import LAParams
+        from pdfminer_cython.pdfpage import PDFPage
+    except ImportError:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfpage import PDFPage
+    PDFMINER_AVAILABLE = True
+except ImportError:
+    PDFMINER_AVAILABLE = False
+
+# PDFium (C++) extracts text several times faster than pdfminer; optional
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+PDF_AVAILABLE = PDFMINER_AVAILABLE or PDFIUM_AVAILABLE
+
+# Batched file writes via io_uring (Linux only)
+try:
+    if sys.platform != 'linux':
+        raise ImportError("io_uring is only available on Linux")
+    from liburing import (
+        io_uring, io_uring_cqe, io_uring_queue_init, io_uring_queue_exit,
+        io_uring_get_sqe, io_uring_prep_write, io_uring_submit,
+        io_uring_wait_cqe, io_uring_cqe_seen, io_uring_sqe_set_data64,
+        io_uring_cqe_get_data64,
+    )
+    LIBURING_AVAILABLE = True
+except ImportError:
+    LIBURING_AVAILABLE = False
+
+LOG = logging.getLogger("pdf_tts_core")
+
+# Extracted pages are reused for a week unless the PDF changes
+DEFAULT_CACHE_TTL_SECS = 7 * 24 * 3600
+
+# Only split parsing across processes when there is enough work to pay
+# for starting them; each worker parses a contiguous range of pages
+PARALLEL_MIN_PAGES = 16
+PARALLEL_PAGES_PER_TASK = 8
+
+# Text cleanup patterns, compiled once for every caller. CR is mapped to
+# newline first; _CLEAN then matches either a line break together with
+# the blank lines and horizontal whitespace around it, or a run of
+# horizontal whitespace, so normalize_text needs a single substitution
+_NORMALIZE_TABLE = str.maketrans({'\r': '\n'})
+_CLEAN = re.compile(r"[^\S\n]*\n(?:[^\S\n]*\n)*[^\S\n]*|[^\S\n]+")
+# Sentence ends: terminal punctuation followed by whitespace or end of text
+_SENTENCE_END = re.compile(r"[.!?](?:\s+|\Z)")
+
+# Voices are listed the first time an engine is created in this process
+_VOICES_LOGGED = False
+
+
+def _clean_match(m) -> str:
+    newlines = m.group(0).count('\n')
+    if not newlines:
+        return ' '
+    # Collapse 3+ newlines into 2 to keep paragraph feel
+    return '\n' if newlines == 1 else '\n\n'
+
+
+def normalize_text(txt: str) -> str:
+    """Clean up spacing; preserve paragraph breaks reasonably"""
+    return _CLEAN.sub(_clean_match, txt.translate(_NORMALIZE_TABLE)).strip()
+
+
+def _iter_sentences(text: str) -> Iterator[str]:
+    """Yield the sentences of text lazily, each stripped"""
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        yield text[start:m.end()].strip()
+        start = m.end()
+    if start < len(text):
+        yield text[start:].strip()
+
+
+def split_into_chunks(text: str, max_chars: int = 1500) -> List[str]:
+    """
+    Split text into chunks that are small enough for TTS engines.
+    Prefer sentence boundaries, then fall back to character chunks.
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    chunks = []
+    buf = []
+    # Length of " ".join(buf), tracked instead of re-joining per sentence
+    buf_len = 0
+
+    def flush_buf():
+        nonlocal buf_len
+        if buf:
+            chunks.append(" ".join(buf))
+            buf.clear()
+        buf_len = 0
+
+    for s in _iter_sentences(text):
+        if not s:
+            continue
+        if len(s) > max_chars:
+            # A single sentence is huge, hard-split it after what is buffered
+            flush_buf()
+            for i in range(0, len(s), max_chars):
+                chunks.append(s[i:i + max_chars])
+            continue
+
+        projected = buf_len + (1 if buf else 0) + len(s)
+        if projected > max_chars:
+            flush_buf()
+            projected = len(s)
+        buf.append(s)
+        buf_len = projected
+
+    flush_buf()
+    return [c for c in chunks if c.strip()]
+
+
+def count_pdf_pages(pdf_path: Path) -> int:
+    """Count pages from the page tree without parsing page contents"""
+    if PDFIUM_AVAILABLE:
+        pdf = pdfium.PdfDocument(str(pdf_path))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with open(pdf_path, 'rb') as fh:
+        return sum(1 for _ in PDFPage.get_pages(fh))
+
+
+# boxes_flow=None keeps line grouping but skips pdfminer's costly text
+# box ordering pass, which is most of its layout time
+_LAPARAMS = LAParams(boxes_flow=None) if PDFMINER_AVAILABLE else None
+
+
+def _parse_pages(pdf_path: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+    """Extract the text of the given zero-based pages (runs in a worker process)"""
+    return [
+        _layout_text(layout)
+        for layout in extract_pages(pdf_path, page_numbers=page_numbers, laparams=_LAPARAMS)
+    ]
+
+
+def _iter_pages_pdfium(pdf_path: str) -> Iterator[str]:
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                # PDFium ends lines with CRLF
+                yield textpage.get_text_range().replace('\r\n', '\n')
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+
+def iter_pdf_pages(pdf_path: Path, workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of each non-empty page as soon as it is parsed.
+    Uses pypdfium2 when installed; otherwise large PDFs are parsed with
+    pdfminer by page range in a process pool, in order.
+    """
+    pdf_path = str(pdf_path)
+    if PDFIUM_AVAILABLE:
+        for text in _iter_pages_pdfium(pdf_path):
+            if text.strip():
+                yield text
+        return
+
+    workers = workers or os.cpu_count() or 1
+    total_pages = count_pdf_pages(pdf_path) if workers > 1 else 0
+
+    executor = None
+    if total_pages >= PARALLEL_MIN_PAGES:
+        try:
+            # Callers may already be running threads (TTS, UI), which
+            # fork() would copy into the children mid-state
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        except (ImportError, NotImplementedError, OSError) as e:
+            # e.g. Android has no working sem_open
+            LOG.info("Process pool unavailable, parsing serially: %s", e)
+
+    if executor is None:
+        for layout in extract_pages(pdf_path, laparams=_LAPARAMS):
+            text = _layout_text(layout)
+            if text.strip():
+                yield text
+        return
+
+    ranges = [
+        list(range(start, min(start + PARALLEL_PAGES_PER_TASK, total_pages)))
+        for start in range(0, total_pages, PARALLEL_PAGES_PER_TASK)
+    ]
+    try:
+        for texts in executor.map(_parse_pages, repeat(pdf_path), ranges):
+            for text in texts:
+                if text.strip():
+                    yield text
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def cache_key(pdf_path: Path) -> str:
+    """Key a PDF by its resolved path, modification time and size"""
+    pdf_path = Path(pdf_path)
+    st = pdf_path.stat()
+    raw = f"{pdf_path.resolve()}|{st.st_mtime_ns}|{st.st_size}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+class PageCache:
+    """
+    Disk cache of normalized page texts, one JSON file per PDF.
+    Entries older than cache_ttl_secs are ignored (0 disables expiry).
+    """
+
+    def __init__(self, cache_dir: Path, cache_ttl_secs: float = DEFAULT_CACHE_TTL_SECS):
+        self.cache_dir = Path(cache_dir)
+        self.cache_ttl_secs = cache_ttl_secs
+
+    def get(self, key: str) -> Optional[List[str]]:
+        path = self.cache_dir / f"{key}.json"
+        try:
+            if self.cache_ttl_secs and time.time() - path.stat().st_mtime > self.cache_ttl_secs:
+                return None
+            return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, pages: List[str]):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / f"{key}.json"
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(pages, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, path)
+        except OSError as e:
+            LOG.warning("Could not write page cache: %s", e)
+
+
+def read_pdf_pages(pdf_path: Path, cache: Optional[PageCache] = None) -> Iterator[str]:
+    """
+    Yield the normalized text of each non-empty page.
+    With a cache, an unchanged PDF is served without parsing it again.
+    """
+    key = cache_key(pdf_path) if cache else None
+    result = cache.get(key) if cache else None
+    if result is not None:
+        yield from result
+        return
+
+    LOG.info("Extracting text from PDF page by page (%s)…",
+             "pypdfium2" if PDFIUM_AVAILABLE else "pdfminer")
+    # Only keep the pages around when they are going into the cache, so
+    # uncached callers hold one page at a time
+    result = [] if cache else None
+    found = 0
+    for page_text in iter_pdf_pages(pdf_path):
+        text = normalize_text(page_text)
+        if text:
+            found += 1
+            if result is not None:
+                result.append(text)
+            yield text
+    LOG.info("Found %d non-empty pages of text.", found)
+
+    if cache:
+        cache.put(key, result)
+
+
+def init_tts_engine(voice_index: Optional[int] = None, rate: Optional[int] = None,
+                    volume: Optional[float] = 1.0):
+    """Create a pyttsx3 engine with the given voice, rate and volume"""
+    global _VOICES_LOGGED
+    import pyttsx3
+
+    engine = pyttsx3.init()  # SAPI5 on Windows, NSSpeechSynth on macOS, eSpeak on Linux
+    voices = engine.getProperty('voices')
+
+    # Print available voices (once)
+    if not _VOICES_LOGGED:
+        _VOICES_LOGGED = True
+        LOG.info("Available voices:")
+        for i, v in enumerate(voices):
+            LOG.info("  [%d] name=%s | id=%s | lang=%s", i, getattr(v, 'name', '?'),
+                     getattr(v, 'id', '?'), getattr(v, 'languages', '?'))
+
+    if voice_index is not None:
+        try:
+            engine.setProperty('voice', voices[voice_index].id)
+        except Exception as e:
+            LOG.warning("Could not set voice index %s (%s). Using default.", voice_index, e)
+
+    if rate is not None:
+        engine.setProperty('rate', int(rate))
+
+    if volume is not None:
+        engine.setProperty('volume', float(volume))
+
+    return engine
+
+
+def _layout_text(layout) -> str:
+    """Concatenate the text of every text element on a laid-out page"""
+    buf = io.StringIO()
+    for element in layout:
+        if hasattr(element, 'get_text'):
+            buf.write(element.get_text())
+    return buf.getvalue()
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard-link src to dst, copying on filesystems without hard links"""
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# Flags for whole-file output writes
+_WRITE_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    | getattr(os, 'O_CLOEXEC', 0) | getattr(os, 'O_BINARY', 0)
+)
+
+
+def write_file(path: Path, data: bytes):
+    """Write bytes to path without Python's buffered file objects"""
+    fd = os.open(path, _WRITE_FLAGS, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if hasattr(os, 'posix_fadvise'):
+            # The file will not be read back; let the page cache drop it
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+class UringWriter:
+    """
+    Collect small whole-file writes and flush them with one io_uring submit.
+    Falls back to direct blocking writes when liburing is not available.
+    """
+
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self.pending: List[Tuple[int, bytes]] = []
+        self.lock = threading.Lock()
+        self.ring = None
+        if LIBURING_AVAILABLE:
+            try:
+                ring = io_uring()
+                io_uring_queue_init(max_batch, ring, 0)
+                self.ring = ring
+                self.cqe = io_uring_cqe()
+            except Exception as e:
+                LOG.warning("io_uring unavailable, using blocking writes: %s", e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, path: Path, data: bytes):
+        """Queue data to be written to path, replacing any existing file"""
+        if self.ring is None:
+            write_file(path, data)
+            return
+
+        # Open up front so the fd exists when the batch is submitted
+        fd = os.open(path, _WRITE_FLAGS, 0o644)
+        with self.lock:
+            self.pending.append((fd, data))
+            if len(self.pending) >= self.max_batch:
+                self._flush()
+
+    def flush(self):
+        """Submit all queued writes and wait for them to complete"""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        try:
+            for i, (fd, data) in enumerate(self.pending):
+                sqe = io_uring_get_sqe(self.ring)
+                io_uring_prep_write(sqe, fd, data, len(data), 0)
+                # Completions arrive in any order; tag each with its entry
+                io_uring_sqe_set_data64(sqe, i)
+            io_uring_submit(self.ring)
+
+            failed = 0
+            for _ in self.pending:
+                io_uring_wait_cqe(self.ring, self.cqe)
+                res = self.cqe.res
+                fd, data = self.pending[io_uring_cqe_get_data64(self.cqe)]
+                io_uring_cqe_seen(self.ring, self.cqe)
+                if res < 0:
+                    failed += 1
+                    LOG.error("io_uring write failed: %s", os.strerror(-res))
+                    continue
+                try:
+                    # A short write is not an error; finish the rest with
+                    # blocking writes, as write_file does
+                    while res < len(data):
+                        res += os.pwrite(fd, memoryview(data)[res:], res)
+                except OSError as e:
+                    failed += 1
+                    LOG.error("io_uring write failed: %s", e)
+        finally:
+            for fd, _ in self.pending:
+                os.close(fd)
+            self.pending.clear()
+
+        if failed:
+            raise OSError(f"{failed} batched write(s) failed")
+
+    def close(self):
+        """Flush pending writes and release the ring"""
+        try:
+            self.flush()
+        finally:
+            if self.ring is not None:
+                io_uring_queue_exit(self.ring)
+                self.ring = None